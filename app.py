@@ -1,33 +1,77 @@
 import os
 import re
 import io
+import gc
 import time
+import queue
 import smtplib
+import threading
 import tempfile
 import pandas as pd
 import streamlit as st
+from concurrent.futures import ThreadPoolExecutor
 from email.header import Header
 from email.mime.text import MIMEText
 from datetime import datetime, timedelta
 
+from helpers import text_values
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
 
 DB_FILE = "debtors_monitoring.csv"
+HEADERS = [
+    "Дата контакта", "ФИО", "Сумма долга", 
+    "Способ информирования", "Статус информирования", "Комментарий"
+]
+
+def monitoring_mtime():
+    # Время изменения файла базы — ключ кэша для load_monitoring_data
+    return os.path.getmtime(DB_FILE) if os.path.exists(DB_FILE) else 0
 
-def load_monitoring_data():
+@st.cache_data(show_spinner=False)
+def load_monitoring_data(mtime: float):
     if os.path.exists(DB_FILE):
         return pd.read_csv(DB_FILE)
     else:
-        return pd.DataFrame(columns=[
-            "Дата контакта", "ФИО", "Сумма долга", 
-            "Способ информирования", "Статус информирования", "Комментарий"
-        ])
+        return pd.DataFrame(columns=HEADERS)
+
+def _frame_hash(df):
+    try:
+        return (tuple(df.columns), len(df), int(pd.util.hash_pandas_object(df, index=False).sum()))
+    except Exception:
+        return None
 
 def save_monitoring_data(df):
-    df.to_csv(DB_FILE, index=False)
+    # Если таблица не менялась с прошлого сохранения (и файл тот же) — ничего не пишем
+    h = _frame_hash(df)
+    saved = st.session_state.get("monitor_saved")
+    if h is not None and saved == (h, monitoring_mtime()):
+        return False
+
+    written = False
+    if HAS_PYARROW:
+        # Многопоточный CSV-писатель Arrow быстрее pandas на object-колонках
+        try:
+            import pyarrow as pa
+            import pyarrow.csv as pa_csv
+            pa_csv.write_csv(pa.Table.from_pandas(df, preserve_index=False), DB_FILE)
+            written = True
+        except Exception:
+            written = False
+    if not written:
+        df.to_csv(DB_FILE, index=False, encoding="utf-8", lineterminator="\n")
 
-def add_to_monitoring(fio, debt, method="E-mail", status="Отправлено", comment=""):
-    df = load_monitoring_data()
-    new_entry = {
+    load_monitoring_data.clear()
+    st.session_state["monitor_saved"] = (h, monitoring_mtime())
+    return True
+
+def monitoring_entry(fio, debt, method="E-mail", status="Отправлено", comment=""):
+    return {
         "Дата контакта": datetime.now().strftime("%d.%m.%Y %H:%M"),
         "ФИО": fio,
         "Сумма долга": debt,
@@ -35,8 +79,17 @@ def add_to_monitoring(fio, debt, method="E-mail", status="Отправлено",
         "Статус информирования": status,
         "Комментарий": comment
     }
-    df = pd.concat([df, pd.DataFrame([new_entry])], ignore_index=True)
-    save_monitoring_data(df)
+
+def add_to_monitoring(entries):
+    # Дописываем накопленные строки в конец файла одной записью, не перечитывая базу
+    if not entries:
+        return
+    write_header = not os.path.exists(DB_FILE) or os.path.getsize(DB_FILE) == 0
+    pd.DataFrame(entries, columns=HEADERS).to_csv(
+        DB_FILE, mode="a", header=write_header, index=False, encoding="utf-8"
+    )
+    # mtime может не измениться на ФС с грубыми метками времени — сбрасываем кэш явно
+    load_monitoring_data.clear()
 
 tab_send, tab_dashboard = st.tabs(["📧 Отправка уведомлений", "📊 Мониторинг и Статусы"])
 
@@ -75,56 +128,89 @@ with tab_send:
         "Email": ["email", "e-mail", "электронная почта", "почта", "mail"],
     }
 
+    _CLEAN_RE = re.compile(r"[\s\._\-]+")
+    _NUM_RE = re.compile(r"[^0-9\.\-]")
+
     def _clean_col(s: str) -> str:
         s = str(s).strip().lower()
-        s = re.sub(r"[\s\._\-]+", " ", s)
+        s = _CLEAN_RE.sub(" ", s)
         return s
 
+    # Очищенные синонимы считаем один раз при загрузке модуля
+    CLEAN_ALIASES = {field: tuple(_clean_col(v) for v in variants) for field, variants in ALIASES.items()}
+
     def auto_map_columns(df: pd.DataFrame) -> dict:
-        cols_clean = {c: _clean_col(c) for c in df.columns}
-        result = {}
-        for field, variants in ALIASES.items():
-            found = None
-            for col, cc in cols_clean.items():
-                for v in variants:
-                    if _clean_col(v) in cc:
-                        found = col
-                        break
-                if found:
-                    break
-            result[field] = found
+        result = dict.fromkeys(ALIASES)
+        for col in df.columns:
+            cc = _clean_col(col)
+            for field, variants in CLEAN_ALIASES.items():
+                if result[field] is None and any(v in cc for v in variants):
+                    result[field] = col
         return result
 
-    def to_number(x):
-        if pd.isna(x):
-            return 0.0
-        if isinstance(x, (int, float)):
-            return float(x)
-        s = str(x)
-        s = s.replace("\u00a0", " ")  # non-breaking space
-        s = s.replace(" ", "")
-        s = s.replace(",", ".")
-        s = re.sub(r"[^0-9\.\-]", "", s)
-        if s in ("", ".", "-", "-.", ".-"):
-            return 0.0
+    def to_number(col: pd.Series) -> pd.Series:
+        # Векторный разбор сумм: "12 345,60 ₽" -> 12345.6, мусор -> 0.0
+        if pd.api.types.is_numeric_dtype(col):
+            # Числа уже числа: без прохода через строки (и без порчи 1e+20 / 1e-05)
+            return pd.to_numeric(col, errors="coerce").fillna(0.0)
+        s = (
+            col.astype("string")
+            .str.replace("\u00a0", " ", regex=False)  # non-breaking space
+            .str.replace(" ", "", regex=False)
+            .str.replace(",", ".", regex=False)
+            .str.replace(_NUM_RE, "", regex=True)
+        )
+        return pd.to_numeric(s, errors="coerce").fillna(0.0)
+
+    PDF_CHUNK_PAGES = 50
+
+    def _pdf_page_count(path: str):
+        # Число страниц нужно camelot для разбиения на диапазоны; pypdf ставится вместе с ним
         try:
-            return float(s)
+            from pypdf import PdfReader  # type: ignore
+            return len(PdfReader(path).pages)
         except Exception:
-            return 0.0
+            return None
+
+    def _first_row_as_header(df: pd.DataFrame) -> pd.DataFrame:
+        if df.shape[0] > 1:
+            df.columns = df.iloc[0].astype(str)
+            df = df.iloc[1:].reset_index(drop=True)
+        return df
+
+    # Кэш по содержимому файла: при смене колонок/настроек (rerun) файл не парсится заново.
+    # Кэш общий для всех сессий, поэтому ограничен по числу файлов.
+    @st.cache_data(show_spinner="Парсим файл...", max_entries=8)
+    def read_table(data: bytes, name: str) -> pd.DataFrame:
+        df = _parse_table(data, name)
+        if HAS_PYARROW:
+            # Компактные Arrow-типы вместо object: меньше памяти и быстрее векторные операции
+            try:
+                df = df.convert_dtypes(dtype_backend="pyarrow")
+            except Exception:
+                pass
+        return df
 
-    def read_table(uploaded_file) -> pd.DataFrame:
-        name = uploaded_file.name.lower()
-        data = uploaded_file.read()
+    def _parse_table(data: bytes, name: str) -> pd.DataFrame:
+        name = name.lower()
 
         if name.endswith(".csv"):
             # пробуем разные разделители
             for sep in [",", ";", "\t"]:
-                try:
-                    df = pd.read_csv(io.BytesIO(data), sep=sep, encoding="utf-8")
-                    if df.shape[1] > 1:
-                        return df
-                except Exception:
-                    pass
+                df = None
+                # Сначала быстрый парсер pyarrow, при ошибке — стандартный C-движок
+                if HAS_PYARROW:
+                    try:
+                        df = pd.read_csv(io.BytesIO(data), sep=sep, encoding="utf-8", engine="pyarrow")
+                    except Exception:
+                        df = None
+                if df is None:
+                    try:
+                        df = pd.read_csv(io.BytesIO(data), sep=sep, encoding="utf-8")
+                    except Exception:
+                        continue
+                if df.shape[1] > 1:
+                    return df
             # fallback
             return pd.read_csv(io.BytesIO(data))
 
@@ -133,45 +219,65 @@ with tab_send:
 
         if name.endswith(".pdf"):
             # PDF поддержка зависит от окружения. Пробуем camelot, затем pdfplumber.
-            with tempfile.NamedTemporaryFile(suffix=".pdf", delete=True) as tmp:
-                tmp.write(data)
-                tmp.flush()
+            # Страницы обрабатываем пачками по PDF_CHUNK_PAGES, чтобы не держать в памяти
+            # состояние всего документа.
 
-                # 1) camelot (лучше для "табличных" PDF)
-                try:
-                    import camelot  # type: ignore
-                    tables = camelot.read_pdf(tmp.name, pages="all")
-                    if tables and len(tables) > 0:
-                        parts = []
-                        for t in tables:
-                            parts.append(t.df)
-                        df = pd.concat(parts, ignore_index=True)
-                        # Попытка: первая строка как заголовок
-                        if df.shape[0] > 1:
-                            df.columns = df.iloc[0].astype(str)
-                            df = df.iloc[1:].reset_index(drop=True)
-                        return df
-                except Exception:
-                    pass
-
-                # 2) pdfplumber (иногда вытаскивает таблицы как списки)
+            # 1) camelot (лучше для "табличных" PDF). Ему нужен путь к файлу,
+            # поэтому только для него пишем временный файл.
+            try:
+                import camelot  # type: ignore
+                fd, tmp_path = tempfile.mkstemp(suffix=".pdf")
                 try:
-                    import pdfplumber  # type: ignore
-                    rows = []
-                    with pdfplumber.open(tmp.name) as pdf:
-                        for page in pdf.pages:
+                    with os.fdopen(fd, "wb") as tmp:
+                        tmp.write(data)
+                        tmp.flush()
+
+                    n_pages = _pdf_page_count(tmp_path)
+                    if n_pages:
+                        page_ranges = [
+                            f"{start}-{min(start + PDF_CHUNK_PAGES - 1, n_pages)}"
+                            for start in range(1, n_pages + 1, PDF_CHUNK_PAGES)
+                        ]
+                    else:
+                        page_ranges = ["all"]
+
+                    chunk_frames = []
+                    for pages in page_ranges:
+                        tables = camelot.read_pdf(tmp_path, pages=pages)
+                        if tables and len(tables) > 0:
+                            chunk_frames.append(pd.concat([t.df for t in tables], ignore_index=True))
+                        del tables
+                        gc.collect()
+                finally:
+                    os.remove(tmp_path)
+                if chunk_frames:
+                    # Попытка: первая строка как заголовок
+                    return _first_row_as_header(pd.concat(chunk_frames, ignore_index=True))
+            except Exception:
+                pass
+
+            # 2) pdfplumber (иногда вытаскивает таблицы как списки). Читает прямо из памяти.
+            try:
+                import pdfplumber  # type: ignore
+                chunk_frames = []
+                with pdfplumber.open(io.BytesIO(data)) as pdf:
+                    pages = pdf.pages
+                    for start in range(0, len(pages), PDF_CHUNK_PAGES):
+                        rows = []
+                        for page in pages[start:start + PDF_CHUNK_PAGES]:
                             table = page.extract_table()
                             if table:
                                 rows.extend(table)
-                    if rows:
-                        df = pd.DataFrame(rows)
-                        # первая строка как заголовок
-                        if df.shape[0] > 1:
-                            df.columns = df.iloc[0].astype(str)
-                            df = df.iloc[1:].reset_index(drop=True)
-                        return df
-                except Exception:
-                    pass
+                            page.close()
+                        if rows:
+                            chunk_frames.append(pd.DataFrame(rows))
+                        del rows
+                        gc.collect()
+                if chunk_frames:
+                    # первая строка как заголовок
+                    return _first_row_as_header(pd.concat(chunk_frames, ignore_index=True))
+            except Exception:
+                pass
 
             raise RuntimeError(
                 "Не удалось прочитать PDF как таблицу. Попробуйте выгрузить данные в Excel/CSV "
@@ -184,29 +290,42 @@ with tab_send:
     # -----------------------------
     # Email sending
     # -----------------------------
-    def send_email_smtp(smtp_host, smtp_port, smtp_user, smtp_password, use_tls, from_addr, to_addr, subject, body):
-        msg = MIMEText(body, "plain", "utf-8")
-        msg["Subject"] = Header(subject, "utf-8")
-        msg["From"] = from_addr
-        msg["To"] = to_addr
-
+    def open_smtp(smtp_host, smtp_port, smtp_user, smtp_password, use_tls):
+        # Одно подключение (TLS + авторизация) на всю рассылку, а не на каждое письмо
         # Если порт 465, используем класс SMTP_SSL (безопасное соединение сразу)
         if smtp_port == 465:
-            with smtplib.SMTP_SSL(smtp_host, smtp_port, timeout=30) as server:
-                if smtp_user:
-                    server.login(smtp_user, smtp_password)
-                server.sendmail(from_addr, [to_addr], msg.as_string())
-        
+            server = smtplib.SMTP_SSL(smtp_host, smtp_port, timeout=30)
+
         # Для порта 587 и других используем обычный SMTP + STARTTLS
         else:
-            with smtplib.SMTP(smtp_host, smtp_port, timeout=30) as server:
+            server = smtplib.SMTP(smtp_host, smtp_port, timeout=30)
+
+        # Если настройка соединения не удалась — закрываем сокет, а не оставляем висеть
+        try:
+            if smtp_port != 465:
                 server.ehlo()
                 if use_tls:
                     server.starttls()
                     server.ehlo()
-                if smtp_user:
-                    server.login(smtp_user, smtp_password)
-                server.sendmail(from_addr, [to_addr], msg.as_string())
+            if smtp_user:
+                server.login(smtp_user, smtp_password)
+        except Exception:
+            server.close()
+            raise
+        return server
+
+    def close_smtp(server):
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+    def send_one(server, from_addr, to_addr, subject, body):
+        msg = MIMEText(body, "plain", "utf-8")
+        msg["Subject"] = Header(subject, "utf-8")
+        msg["From"] = from_addr
+        msg["To"] = to_addr
+        server.sendmail(from_addr, [to_addr], msg.as_string())
 
 
     # -----------------------------
@@ -232,7 +351,7 @@ with tab_send:
         st.stop()
 
     try:
-        df_raw = read_table(uploaded)
+        df_raw = read_table(uploaded.getvalue(), uploaded.name)
     except Exception as e:
         st.error(str(e))
         st.stop()
@@ -289,9 +408,10 @@ with tab_send:
     df = df_raw.copy()
 
     debt_col = col_map["Сумма долга"]
-    df["_debt"] = df[debt_col].apply(to_number)
+    df["_debt"] = to_number(df[debt_col])
 
-    debtors = df[df["_debt"] > 0].copy()
+    mask = df["_debt"] > 0
+    debtors = df.loc[mask]
     st.subheader("4) Должники")
     c1, c2, c3 = st.columns(3)
     c1.metric("Всего строк", len(df))
@@ -350,30 +470,31 @@ with tab_send:
     # 3. Настройки процесса
     sleep_time = st.slider("Задержка между письмами (сек)", 0.0, 5.0, 1.0, step=0.5, 
                         help="Gmail может заблокировать за спам, если слать слишком быстро.")
+    n_workers = st.slider("Параллельных SMTP-подключений", 1, 8, 1,
+                        help="Каждое подключение шлет свою часть писем со своей задержкой, "
+                             "поэтому общая скорость растет пропорционально. Для Gmail оставьте 1.")
 
     dry_run = st.checkbox("Тестовый прогон (не отправлять, только сформировать)", value=False)
 
     def format_money(x: float) -> str:
         # 12345.6 -> 12 345.60
-        s = f"{x:,.2f}"
-        s = s.replace(",", " ")
-        return s
+        return f"{x:,.2f}".replace(",", " ")
+
+    # Даты одинаковые для всех писем — подставляем их в шаблон один раз
+    today_str = today.strftime("%d.%m.%Y")
+    due_str = due.strftime("%d.%m.%Y")
+    template_parts = template.replace("{TODAY}", today_str).replace("{DUE}", due_str)
 
     def make_body(fio: str, debt: float) -> str:
-        return template.format(
-            FIO=fio,
-            DEBT=format_money(debt),
-            TODAY=today.strftime("%d.%m.%Y"),
-            DUE=due.strftime("%d.%m.%Y"),
-        )
+        return template_parts.replace("{DEBT}", format_money(debt)).replace("{FIO}", fio)
 
     # Предпросмотр одного письма
     st.subheader("7) Предпросмотр")
     if len(debtors) > 0:
         fio_col = col_map["ФИО"]
-        sample = debtors.iloc[0]
-        sample_fio = str(sample.get(fio_col, "")).strip()
-        sample_debt = float(sample["_debt"])
+        # Берем значения по позиции, не собирая Series для всей строки
+        sample_fio = text_values(debtors[fio_col].iloc[:1])[0]
+        sample_debt = float(debtors["_debt"].iat[0])
         st.text_area("Пример письма", value=make_body(sample_fio, sample_debt), height=180)
     else:
         st.info("Должников нет — отправлять нечего.")
@@ -401,104 +522,200 @@ with tab_send:
         fio_col = col_map["ФИО"]
         email_col = col_map.get("Email")
 
-        log_rows = []
-        
         # Инициализация прогресс-бара
         progress_bar = st.progress(0)
         status_text = st.empty()
 
-        total = len(debtors)
         ok = 0
         fail = 0
 
-        # ЦИКЛ ОТПРАВКИ
-        for idx, row in enumerate(debtors.itertuples(index=False), start=1):
-            # 1. СНАЧАЛА получаем данные (до блока try), чтобы переменные точно существовали
-            r = debtors.iloc[idx - 1]
-            
-            # Безопасное получение ФИО
-            fio = str(r.get(fio_col, "")).strip()
-            
-            # Безопасное получение Долга
-            debt = float(r.get("_debt", 0.0))
-
-            # Определение получателя
-            if mode == "Использовать Email из каждой строки (колонка Email)":
-                raw_email = str(r.get(email_col, "")).strip() if email_col else ""
-                to_addr = raw_email
-            else:
-                to_addr = common_email
+        # Достаем нужные колонки списками один раз, до цикла
+        fios = text_values(debtors[fio_col])
+        debts = debtors["_debt"].astype(float).tolist()
+        if email_col:
+            emails = text_values(debtors[email_col])
+        else:
+            emails = [""] * len(debtors)
+
+        # Режим и задержка не меняются во время рассылки — определяем их один раз
+        use_row_email = (mode == "Использовать Email из каждой строки (колонка Email)")
+        delay = sleep_time if not dry_run else 0.0
+
+        # Определение получателя
+        to_addrs = emails if use_row_email else [common_email] * len(emails)
+
+        # Убираем дубликаты, чтобы не слать одно и то же письмо дважды
+        recipients = pd.DataFrame({"fio": fios, "debt": debts, "to_addr": to_addrs})
+        account_col = col_map.get("Личный счет")
+        if account_col:
+            # Повтор одного и того же лицевого счета — лишняя строка, а не второй долг
+            accounts = pd.Series(text_values(debtors[account_col]))
+            keep = ~accounts.duplicated() | (accounts == "")
+            recipients = recipients[keep.to_numpy()].reset_index(drop=True)
+        if use_row_email:
+            # Одно письмо на адрес: ФИО через "; ", долги суммируются.
+            # Некорректные адреса не склеиваем — ошибка должна остаться по каждой строке.
+            valid = recipients["to_addr"].str.contains("@", regex=False)
+            key = recipients["to_addr"].str.lower().where(valid, "#" + recipients.index.to_series().astype(str))
+            recipients = recipients.groupby(key, sort=False).agg(
+                fio=("fio", lambda s: "; ".join(map(str, s))),
+                debt=("debt", "sum"),
+                to_addr=("to_addr", "first"),
+            )
 
-            # Формируем тело письма
-            body = make_body(fio, debt)
+        # Список писем: (номер, ФИО, долг, получатель)
+        items = list(zip(
+            range(len(recipients)),
+            recipients["fio"].tolist(),
+            recipients["debt"].tolist(),
+            recipients["to_addr"].tolist(),
+        ))
+        total = len(items)
+        if total < len(debtors):
+            st.info(f"Дубликаты объединены: {len(debtors)} строк → {total} писем.")
+
+        # Потоки кладут сюда по одному результату на каждое письмо:
+        # (номер строки, строка лога, запись для мониторинга или None)
+        results = queue.Queue()
+        # Сигнал потокам остановиться, если основной запуск прерван
+        stop_sending = threading.Event()
+
+        def send_shard(shard):
+            # У каждого потока свое SMTP-соединение. Streamlit из потоков не вызываем —
+            # интерфейс обновляет только основной поток.
+            server = None
+            if not dry_run:
+                try:
+                    server = open_smtp(smtp_host, int(smtp_port), smtp_user, smtp_password, use_tls)
+                except Exception as e:
+                    for idx, fio, debt, to_addr in shard:
+                        results.put((idx, {
+                            "ФИО": fio, 
+                            "Email": to_addr, 
+                            "Долг": debt, 
+                            "Статус": "Ошибка", 
+                            "Комментарий": f"Нет подключения к SMTP: {e}"
+                        }, None))
+                    return
 
-            # 2. ТЕПЕРЬ пытаем отправить
             try:
-                # Проверка на корректность email (базовая)
-                if "@" not in to_addr:
-                    raise ValueError("Некорректный Email адрес")
-
-                if dry_run:
-                    # Тестовый режим - просто имитируем успех
-                    ok += 1
-                    log_rows.append({
-                        "ФИО": fio, 
-                        "Email": to_addr, 
-                        "Долг": debt, 
-                        "Статус": "OK (dry-run)", 
-                        "Комментарий": "Тест (не отправлено)"
-                    })
-                else:
-                    # Реальная отправка
-                    send_email_smtp(
-                        smtp_host=smtp_host,
-                        smtp_port=int(smtp_port),
-                        smtp_user=smtp_user,
-                        smtp_password=smtp_password,
-                        use_tls=use_tls,
-                        from_addr=from_addr,
-                        to_addr=to_addr,
-                        subject=subject,
-                        body=body,
-                    )
-
-                    add_to_monitoring(
-                        fio=fio, 
-                        debt=debt, 
-                        method="E-mail", 
-                        status="Доставлено (авто)", 
-                        comment=f"Отправлено на {to_addr}"
-                    )
-                    
-                    # Задержка, чтобы Gmail не заблокировал (берем из слайдера или ставим 1 сек)
-                    if 'sleep_time' in locals():
-                        time.sleep(sleep_time)
-                    else:
-                        time.sleep(1) 
-
-                    ok += 1
-                    log_rows.append({
-                        "ФИО": fio, 
-                        "Email": to_addr, 
-                        "Долг": debt, 
-                        "Статус": "OK", 
-                        "Комментарий": ""
-                    })
-
-            except Exception as e:
-                fail += 1
-                # Теперь fio и to_addr точно существуют, ошибка NameError исчезнет
-                log_rows.append({
-                    "ФИО": fio, 
-                    "Email": to_addr, 
-                    "Долг": debt, 
-                    "Статус": "Ошибка", 
-                    "Комментарий": str(e)
-                })
-
-            # Обновляем UI
-            progress_bar.progress(idx / total)
-            status_text.write(f"Обработано {idx}/{total} | Успешно: {ok} | Ошибок: {fail}")
+                for idx, fio, debt, to_addr in shard:
+                    if stop_sending.is_set():
+                        break
+                    try:
+                        # Проверка на корректность email (базовая)
+                        if "@" not in to_addr:
+                            raise ValueError("Некорректный Email адрес")
+
+                        # Формируем тело письма
+                        body = make_body(fio, debt)
+
+                        if dry_run:
+                            # Тестовый режим - просто имитируем успех
+                            results.put((idx, {
+                                "ФИО": fio, 
+                                "Email": to_addr, 
+                                "Долг": debt, 
+                                "Статус": "OK (dry-run)", 
+                                "Комментарий": "Тест (не отправлено)"
+                            }, None))
+                            continue
+
+                        # Реальная отправка через открытое соединение
+                        try:
+                            send_one(server, from_addr, to_addr, subject, body)
+                        except smtplib.SMTPServerDisconnected:
+                            # Сервер закрыл соединение — переподключаемся и повторяем один раз
+                            server = open_smtp(smtp_host, int(smtp_port), smtp_user, smtp_password, use_tls)
+                            send_one(server, from_addr, to_addr, subject, body)
+
+                        entry = monitoring_entry(
+                            fio=fio, 
+                            debt=debt, 
+                            method="E-mail", 
+                            status="Доставлено (авто)", 
+                            comment=f"Отправлено на {to_addr}"
+                        )
+                        results.put((idx, {
+                            "ФИО": fio, 
+                            "Email": to_addr, 
+                            "Долг": debt, 
+                            "Статус": "OK", 
+                            "Комментарий": ""
+                        }, entry))
+
+                        # Задержка, чтобы Gmail не заблокировал (своя в каждом потоке)
+                        if delay:
+                            stop_sending.wait(delay)
+
+                    except Exception as e:
+                        results.put((idx, {
+                            "ФИО": fio, 
+                            "Email": to_addr, 
+                            "Долг": debt, 
+                            "Статус": "Ошибка", 
+                            "Комментарий": str(e)
+                        }, None))
+            finally:
+                if server is not None:
+                    close_smtp(server)
+
+        # Раскладываем письма по потокам по кругу
+        workers = max(1, min(n_workers, total))
+        shards = [items[i::workers] for i in range(workers)]
+
+        done_rows = []
+        pending_monitor = []
+
+        # ЦИКЛ ОТПРАВКИ
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(send_shard, shard) for shard in shards]
+                try:
+                    processed = 0
+                    ui_step = max(1, total // 100)
+                    while processed < total:
+                        try:
+                            idx, log_row, entry = results.get(timeout=0.5)
+                        except queue.Empty:
+                            if all(f.done() for f in futures) and results.empty():
+                                break
+                            continue
+
+                        processed += 1
+                        done_rows.append((idx, log_row))
+                        if entry is not None:
+                            pending_monitor.append(entry)
+                        if log_row["Статус"] == "Ошибка":
+                            fail += 1
+                        else:
+                            ok += 1
+
+                        # Обновляем UI не на каждое письмо, а примерно на каждый процент
+                        if processed % ui_step == 0 or processed == total:
+                            progress_bar.progress(processed / total)
+                            status_text.write(f"Обработано {processed}/{total} | Успешно: {ok} | Ошибок: {fail}")
+
+                    # Неожиданные ошибки потоков не должны теряться молча
+                    for f in futures:
+                        f.result()
+                finally:
+                    # Без этого при прерывании executor дождался бы отправки всей пачки
+                    stop_sending.set()
+        finally:
+            # Даже если запуск прерван (rerun/ошибка), уже отправленные письма попадают в базу
+            while True:
+                try:
+                    _, _, entry = results.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is not None:
+                    pending_monitor.append(entry)
+            add_to_monitoring(pending_monitor)
+
+        # Лог в порядке строк исходной таблицы
+        done_rows.sort(key=lambda x: x[0])
+        log_rows = [row for _, row in done_rows]
 
         st.success(f"Готово. Успешно: {ok}, Ошибок: {fail}")
 
@@ -508,15 +725,23 @@ with tab_send:
 
         # Скачивание файла
         out = io.BytesIO()
-        with pd.ExcelWriter(out, engine="openpyxl") as writer:
+        with pd.ExcelWriter(out, engine="xlsxwriter") as writer:
             log_df.to_excel(writer, index=False, sheet_name="log")
         
-        st.download_button(
+        dl1, dl2 = st.columns(2)
+        dl1.download_button(
             "⬇️ Скачать лог отправки (Excel)",
             data=out.getvalue(),
             file_name="email_send_log.xlsx",
             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
         )
+        # CSV формируется почти мгновенно; utf-8-sig, чтобы Excel правильно открыл кириллицу
+        dl2.download_button(
+            "⬇️ Скачать лог отправки (CSV)",
+            data=log_df.to_csv(index=False).encode("utf-8-sig"),
+            file_name="email_send_log.csv",
+            mime="text/csv",
+        )
 
 
 # --- ВКЛАДКА 2: ДАШБОРД ---
@@ -525,7 +750,7 @@ with tab_dashboard:
 
     st.header("📊 Журнал работы с задолженностью")
     
-    df_monitor = load_monitoring_data()
+    df_monitor = load_monitoring_data(monitoring_mtime())
     
     if not df_monitor.empty:
         # Статистика в ряд
@@ -545,9 +770,10 @@ with tab_dashboard:
         with col_f2:
             filter_status = st.multiselect("Фильтр статуса", df_monitor["Статус информирования"].unique())
 
-        display_df = df_monitor.copy()
+        # Фильтры возвращают новые таблицы, копия исходной не нужна
+        display_df = df_monitor
         if search_fio:
-            display_df = display_df[display_df["ФИО"].str.contains(search_fio, case=False)]
+            display_df = display_df[display_df["ФИО"].str.contains(search_fio, case=False, regex=False, na=False)]
         if filter_status:
             display_df = display_df[display_df["Статус информирования"].isin(filter_status)]
 
@@ -572,8 +798,10 @@ with tab_dashboard:
         if st.button("💾 Сохранить изменения в файл"):
             # Если мы фильтровали данные, нужно объединить изменения с основной базой
             # Для простоты в демо: сохраняем то, что на экране (если фильтры не пустые, будьте осторожны)
-            save_monitoring_data(edited_df)
-            st.success("База обновлена!")
+            if save_monitoring_data(edited_df):
+                st.success("База обновлена!")
+            else:
+                st.info("Изменений нет — файл не перезаписан.")
             time.sleep(1)
             st.rerun()
     else:
@@ -595,16 +823,15 @@ with tab_dashboard:
             
             if submit_add:
                 if fio_input:
-                    new_entry = {
-                        "Дата контакта": datetime.now().strftime("%d.%m.%Y %H:%M"),
-                        "ФИО": fio_input,
-                        "Сумма долга": debt_input,
-                        "Способ информирования": method,
-                        "Статус информирования": status,
-                        "Комментарий": comment
-                    }
-                    df_monitor = pd.concat([df_monitor, pd.DataFrame([new_entry])], ignore_index=True)
-                    save_monitoring_data(df_monitor)
+                    # Одна новая строка — дописываем в конец файла, а не перезаписываем базу
+                    add_to_monitoring([monitoring_entry(
+                        fio=fio_input,
+                        debt=debt_input,
+                        method=method,
+                        status=status,
+                        comment=comment
+                    )])
+                    df_monitor = load_monitoring_data(monitoring_mtime())
                     st.success("Данные добавлены!")
                 else:
                     st.error("Введите ФИО!")
@@ -633,8 +860,10 @@ with tab_dashboard:
         
         # Кнопка сохранения изменений в таблице
         if st.button("Сохранить изменения в таблице"):
-            save_monitoring_data(edited_df)
-            st.success("Изменения сохранены в файл!")
+            if save_monitoring_data(edited_df):
+                st.success("Изменения сохранены в файл!")
+            else:
+                st.info("Изменений нет — файл не перезаписан.")
             st.rerun()
             
     else:
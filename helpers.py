@@ -0,0 +1,7 @@
+import pandas as pd
+
+
+def text_values(col: pd.Series) -> list:
+    # Значения колонки как строки без пробелов по краям; пустые ячейки -> "".
+    # Через "string", а не fillna("") напрямую: Arrow-колонки int64/null не принимают "".
+    return col.astype("string").fillna("").str.strip().tolist()
@@ -0,0 +1,30 @@
+import io
+
+import pandas as pd
+import pytest
+
+from helpers import text_values
+
+
+def test_blank_email_column_from_csv():
+    pytest.importorskip("pyarrow")
+    data = "ФИО,Сумма долга,Email\nИванов,100,\nПетров,200,\n"
+    df = pd.read_csv(io.StringIO(data), engine="pyarrow").convert_dtypes(dtype_backend="pyarrow")
+    assert text_values(df["Email"]) == ["", ""]
+
+
+def test_blank_email_column_from_excel_nan():
+    pytest.importorskip("pyarrow")
+    df = pd.DataFrame({"Email": [float("nan"), float("nan")]}).convert_dtypes(dtype_backend="pyarrow")
+    assert text_values(df["Email"]) == ["", ""]
+
+
+def test_numeric_account_with_blank_cell():
+    pytest.importorskip("pyarrow")
+    df = pd.DataFrame({"Личный счет": [1001, None, 1003]}).convert_dtypes(dtype_backend="pyarrow")
+    assert text_values(df["Личный счет"]) == ["1001", "", "1003"]
+
+
+def test_text_is_stripped_and_blanks_are_empty():
+    s = pd.Series([" Иванов И.И. ", None, "Петров"])
+    assert text_values(s) == ["Иванов И.И.", "", "Петров"]